@@ -1,8 +1,21 @@
 # RailwayServer.py
 import os
+import re
 import sys
+import asyncio
+import threading
 import requests
+import aiohttp
+import orjson
+import ijson
 import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from operator import itemgetter
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cachetools import TTLCache
 from fastmcp import FastMCP
 from dotenv import load_dotenv
 
@@ -11,49 +24,138 @@ logging.basicConfig(level=logging.INFO, stream=sys.stderr, force=True)
 
 load_dotenv()
 
-mcp = FastMCP("IRCTC-Assistant")
+@asynccontextmanager
+async def _lifespan(server):
+    try:
+        yield {}
+    finally:
+        # Close the search_trains session on the loop that created it
+        if _ASYNC_SESSION is not None and not _ASYNC_SESSION.closed:
+            await _ASYNC_SESSION.close()
+
+
+mcp = FastMCP("IRCTC-Assistant", lifespan=_lifespan)
 
 # Validate API key on startup
 RAPIDAPI_KEY = os.getenv("RAPIDAPI_KEY")
 if not RAPIDAPI_KEY:
     logging.warning("RAPIDAPI_KEY not found in environment variables!")
 
-# Helper to get headers
-def get_headers():
+# Request headers, built once and shared by the sync and async sessions
+_HEADERS = {"x-rapidapi-host": "irctc-api2.p.rapidapi.com"}
+if RAPIDAPI_KEY:
+    _HEADERS["x-rapidapi-key"] = RAPIDAPI_KEY
+
+
+def _require_api_key():
+    """Fail fast with a clear message instead of sending an unauthenticated request."""
     if not RAPIDAPI_KEY:
         raise ValueError("RAPIDAPI_KEY is not configured. Please set it in .env file.")
-    return {
-        "x-rapidapi-key": RAPIDAPI_KEY,
-        "x-rapidapi-host": "irctc-api2.p.rapidapi.com"
-    }
+
+
+def _timeout_error(tool: str, e: requests.exceptions.Timeout) -> dict:
+    """Log a RapidAPI timeout and report whether connecting or reading timed out."""
+    kind = "connect_timeout" if isinstance(e, requests.exceptions.ConnectTimeout) else "read_timeout"
+    logging.warning(f"{tool}: {kind} ({e})")
+    return {"error": kind}
+
+
+# Shared session so every tool reuses pooled keep-alive connections to RapidAPI
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=50,
+    # Connect failures are retried; read timeouts surface immediately (read=False)
+    max_retries=Retry(total=2, read=False, backoff_factor=0.2, status_forcelist=[429, 500, 502, 503, 504])
+))
+SESSION.headers.update(_HEADERS)
+
+# Input formats for PNR and train numbers
+_PNR_RE = re.compile(r"[0-9]{10}")
+_TRAIN_RE = re.compile(r"[0-9]{4,5}")
+_CODE_RE = re.compile(r"[A-Z]{2,5}")
+
+# (connect, read) timeouts - quick lookups vs heavier availability/schedule payloads
+SHORT_TIMEOUT = (3.05, 7)
+LONG_TIMEOUT = (3.05, 12)
+
+# Station codes and train schedules rarely change, so successful lookups are cached.
+# Live status / live station data is time-sensitive and intentionally not cached.
+# TTLCache is not thread-safe and FastMCP runs sync tools in a threadpool, so every
+# read and write goes through the cache's lock (never held across a network call).
+STATION_CACHE = TTLCache(maxsize=2048, ttl=24 * 3600)
+STATION_CACHE_LOCK = threading.Lock()
+SCHEDULE_CACHE = TTLCache(maxsize=1024, ttl=3600)
+SCHEDULE_CACHE_LOCK = threading.Lock()
+# Availability is short-lived but shared by get_fare and check_seat_availability,
+# so asking for a fare right after checking seats reuses the same response.
+AVAIL_CACHE = TTLCache(maxsize=512, ttl=300)
+AVAIL_CACHE_LOCK = threading.Lock()
+
+# Default journey date as a (day, value) pair, recomputed only when the calendar
+# day changes. Swapped in a single assignment so threadpool callers never see a
+# new day paired with a stale value
+_TOMORROW_CACHE = (None, None)
+
+
+def _tomorrow_ddmmyyyy() -> str:
+    """Return tomorrow's date as DD-MM-YYYY."""
+    global _TOMORROW_CACHE
+    today = datetime.now().date()
+    day, value = _TOMORROW_CACHE
+    if day != today:
+        value = (today + timedelta(days=1)).strftime("%d-%m-%Y")
+        _TOMORROW_CACHE = (today, value)
+    return value
+
+
+# Fallback field names seen across pnrStatus response versions
+_DATE_KEYS = ("dateOfJourney", "doj", "journeyDate", "date")
+_FROM_KEYS = ("from", "fromStation")
+_TO_KEYS = ("to", "toStation")
+_CLASS_KEYS = ("class", "journeyClass")
+_CHART_KEYS = ("chartStatus", "chartPrepared")
+
+
+def _first(data: dict, keys: tuple, default="N/A"):
+    """Return the first non-empty value among `keys` in `data`, else `default`."""
+    return next((data[k] for k in keys if data.get(k) not in (None, "")), default)
+
+
+def _pluck(getter: itemgetter, defaults: dict, row: dict) -> tuple:
+    """Read several fields from an API row in one C-level call, filling in defaults for missing keys."""
+    try:
+        return getter(row)
+    except KeyError:
+        return getter({**defaults, **row})
+
+
+_PASSENGER_DEFAULTS = {
+    "bookingStatus": "N/A",
+    "currentStatus": "N/A"
+}
+_PASSENGER_FIELDS = itemgetter(*_PASSENGER_DEFAULTS)
+
 
 @mcp.tool()
 def get_pnr_status(pnr: str) -> dict:
     """Fetch detailed PNR status including train time, number, stations, and passenger status."""
     logging.info(f"Fetching PNR: {pnr}")
     
-    if not pnr.isdigit() or len(pnr) != 10:
+    if not _PNR_RE.fullmatch(pnr):
         return {"error": "PNR must be exactly 10 digits"}
 
     url = "https://irctc-api2.p.rapidapi.com/pnrStatus"
     
     try:
-        r = requests.get(url, headers=get_headers(), params={"pnr": pnr}, timeout=15)
+        _require_api_key()
+        r = SESSION.get(url, params={"pnr": pnr}, timeout=SHORT_TIMEOUT)
         r.raise_for_status()
-        data = r.json().get("data", {})
+        data = orjson.loads(r.content).get("data", {})
         
         if not data:
             return {"error": "No data found. PNR might be invalid."}
 
-        # Handle multiple possible field names for journey date
-        journey_date = (
-            data.get("dateOfJourney") or
-            data.get("doj") or
-            data.get("journeyDate") or
-            data.get("date") or
-            "N/A"
-        )
-
         return {
             "pnr": pnr,
             "train_info": {
@@ -61,24 +163,29 @@ def get_pnr_status(pnr: str) -> dict:
                 "number": data.get("trainNumber", "Unknown"),
             },
             "journey_details": {
-                "date_of_journey": journey_date,
+                "date_of_journey": _first(data, _DATE_KEYS),
                 "departure_time": data.get("departureTime", "N/A"),
                 "arrival_time": data.get("arrivalTime", "N/A"),
-                "from_station": data.get("from") or data.get("fromStation", "N/A"),
-                "to_station": data.get("to") or data.get("toStation", "N/A"),
+                "from_station": _first(data, _FROM_KEYS),
+                "to_station": _first(data, _TO_KEYS),
                 "duration": data.get("duration", "N/A"),
-                "class": data.get("class") or data.get("journeyClass", "N/A"),
-                "chart_status": data.get("chartStatus") or data.get("chartPrepared", "N/A")
+                "class": _first(data, _CLASS_KEYS),
+                "chart_status": _first(data, _CHART_KEYS)
             },
             "passengers": [
                 {
-                    "number": idx + 1,
-                    "booking_status": p.get("bookingStatus", "N/A"),
-                    "current_status": p.get("currentStatus", "N/A")
+                    "number": idx,
+                    "booking_status": booking_status,
+                    "current_status": current_status
                 }
-                for idx, p in enumerate(data.get("passengers", []))
+                for idx, (booking_status, current_status) in enumerate(
+                    (_pluck(_PASSENGER_FIELDS, _PASSENGER_DEFAULTS, p) for p in data.get("passengers", [])),
+                    start=1
+                )
             ]
         }
+    except requests.exceptions.Timeout as e:
+        return _timeout_error("get_pnr_status", e)
     except Exception as e:
         return {"error": str(e)}
 
@@ -93,17 +200,30 @@ def resolve_station_code(station_name: str) -> dict:
     if not station_name or not station_name.strip():
         return {"error": "Station name is required"}
 
+    # Already a station code (e.g. 'NDLS') - no lookup needed. Only all-caps input is
+    # treated as a code so city names like 'Pune' or 'Agra' still get resolved.
+    code = station_name.strip()
+    if _CODE_RE.fullmatch(code) and code not in CITY_STATION_MAP:
+        return {"match_found": True, "stations": [{"name": code, "code": code, "location": ""}]}
+
+    cache_key = station_name.strip().lower()
+    with STATION_CACHE_LOCK:
+        cached = STATION_CACHE.get(cache_key)
+    if cached:
+        return cached
+
     url = "https://irctc-api2.p.rapidapi.com/stationSearch"
     
     try:
-        r = requests.get(url, headers=get_headers(), params={"code": station_name}, timeout=10)
+        _require_api_key()
+        r = SESSION.get(url, params={"code": station_name}, timeout=SHORT_TIMEOUT)
         r.raise_for_status()
-        data = r.json().get("data", [])
+        data = orjson.loads(r.content).get("data", [])
         
         if not data:
             return {"error": f"No station found for '{station_name}'"}
 
-        return {
+        result = {
             "match_found": True,
             "stations": [
                 {
@@ -114,14 +234,31 @@ def resolve_station_code(station_name: str) -> dict:
                 for s in data[:5]
             ]
         }
+        with STATION_CACHE_LOCK:
+            STATION_CACHE[cache_key] = result
+        return result
+    except requests.exceptions.Timeout as e:
+        return _timeout_error("resolve_station_code", e)
     except Exception as e:
         return {"error": f"Station search failed: {str(e)}"}
 
+_LIVE_TRAIN_DEFAULTS = {
+    "trainNumber": None,
+    "trainName": None,
+    "scheduledDeparture": None,
+    "expectedDeparture": None,
+    "delay": "On Time",
+    "platform": "TBD"
+}
+_LIVE_TRAIN_FIELDS = itemgetter(*_LIVE_TRAIN_DEFAULTS)
+
+
 @mcp.tool()
-def get_live_station_trains(source: str, destination: str, hours: int = 4) -> dict:
+def get_live_station_trains(source: str, destination: str, hours: int = 4, max_results: int = 25) -> dict:
     """
     Fetch trains running between two stations in the next N hours.
     Requires Station CODES (e.g., 'NDLS', 'CNB').
+    Returns at most max_results trains (default 25).
     """
     logging.info(f"Searching live trains: {source} -> {destination} (next {hours}h)")
 
@@ -138,10 +275,11 @@ def get_live_station_trains(source: str, destination: str, hours: int = 4) -> di
     }
     
     try:
-        r = requests.get(url, headers=get_headers(), params=params, timeout=10)
+        _require_api_key()
+        r = SESSION.get(url, params=params, timeout=SHORT_TIMEOUT)
         r.raise_for_status()
         
-        json_resp = r.json()
+        json_resp = orjson.loads(r.content)
         data = json_resp.get("data", {})
         raw_trains = data.get("trains", [])
 
@@ -150,14 +288,15 @@ def get_live_station_trains(source: str, destination: str, hours: int = 4) -> di
 
         # Format the output based on your verified output structure
         formatted_trains = []
-        for t in raw_trains:
+        for t in raw_trains[:max_results]:
+            number, name, scheduled, expected, delay, platform = _pluck(_LIVE_TRAIN_FIELDS, _LIVE_TRAIN_DEFAULTS, t)
             formatted_trains.append({
-                "train_number": t.get("trainNumber"),
-                "train_name": t.get("trainName"),
-                "scheduled_departure": t.get("scheduledDeparture"),
-                "expected_departure": t.get("expectedDeparture"),
-                "delay": t.get("delay", "On Time"),
-                "platform": t.get("platform", "TBD")
+                "train_number": number,
+                "train_name": name,
+                "scheduled_departure": scheduled,
+                "expected_departure": expected,
+                "delay": delay,
+                "platform": platform
             })
             
         return {
@@ -167,79 +306,146 @@ def get_live_station_trains(source: str, destination: str, hours: int = 4) -> di
             "trains": formatted_trains
         }
 
+    except requests.exceptions.Timeout as e:
+        return _timeout_error("get_live_station_trains", e)
     except Exception as e:
         logging.error(f"Live Station API Error: {e}")
         return {"error": str(e)}
 
 
+_SCHEDULE_DEFAULTS = {
+    "station_name": "N/A",
+    "station_code": "N/A",
+    "state_name": "N/A",
+    "std_min": None,
+    "day": 1,
+    "platform_number": "N/A",
+    "stop": False
+}
+_SCHEDULE_FIELDS = itemgetter(*_SCHEDULE_DEFAULTS)
+
+
+@dataclass(slots=True)
+class Stop:
+    """One station on a train's route, as returned by get_train_schedule."""
+    station_name: str
+    station_code: str
+    state: str
+    departure_time: str
+    day: int
+    platform: str
+    is_stop: bool
+
+
+# Precomputed "HH:MM" strings for every minute of the day
+_MIN_TO_HHMM = tuple(f"{m // 60:02d}:{m % 60:02d}" for m in range(1440))
+
+
 def minutes_to_time(minutes: int) -> str:
     """Convert minutes from midnight to HH:MM format."""
     if minutes is None:
         return "N/A"
+    if 0 <= minutes < 1440:
+        return _MIN_TO_HHMM[minutes]
     hours = minutes // 60
     mins = minutes % 60
     return f"{hours:02d}:{mins:02d}"
 
+def _schedule_response(schedule: dict, include_full_route: bool) -> dict:
+    """Cached schedules always hold full_route; strip it unless the caller asked for it."""
+    if include_full_route:
+        return schedule
+    return {k: v for k, v in schedule.items() if k != "full_route"}
+
+
 @mcp.tool()
-def get_train_schedule(train_number: str) -> dict:
+def get_train_schedule(train_number: str, include_full_route: bool = False) -> dict:
     """
     Get complete schedule/route of a train with all station stops and timings.
-    Use this to find all stations a train passes through.
+    Returns the stations where the train stops; set include_full_route=True
+    to also get every station it passes through.
     """
     logging.info(f"Fetching schedule for train: {train_number}")
 
     # Clean input
     train_number = train_number.strip()
 
-    if not train_number.isdigit() or len(train_number) not in [4, 5]:
+    if not _TRAIN_RE.fullmatch(train_number):
         return {"error": "Train number must be 4-5 digits"}
 
+    with SCHEDULE_CACHE_LOCK:
+        cached = SCHEDULE_CACHE.get(train_number)
+    if cached:
+        return _schedule_response(cached, include_full_route)
+
     url = "https://irctc-api2.p.rapidapi.com/trainSchedule"
 
     try:
-        r = requests.get(url, headers=get_headers(),
-                        params={"trainNumber": train_number}, timeout=15)
+        _require_api_key()
+        r = SESSION.get(url, params={"trainNumber": train_number}, timeout=LONG_TIMEOUT)
         r.raise_for_status()
-        data = r.json().get("data", [])
+        data = orjson.loads(r.content).get("data", [])
 
         if not data:
             return {"error": f"No schedule found for train {train_number}"}
 
         # Format the schedule - data is an array of stations
         stops = []
-        major_stops = []
-
         for station in data:
-            std_min = station.get("std_min")
-            is_stop = station.get("stop", False)
-
-            stop_info = {
-                "station_name": station.get("station_name", "N/A"),
-                "station_code": station.get("station_code", "N/A"),
-                "state": station.get("state_name", "N/A"),
-                "departure_time": minutes_to_time(std_min),
-                "day": station.get("day", 1),
-                "platform": station.get("platform_number", "N/A"),
-                "is_stop": is_stop
-            }
-            stops.append(stop_info)
-
-            # Collect major stops (where train actually stops)
-            if is_stop:
-                major_stops.append(stop_info)
+            name, code, state, std_min, day, platform, is_stop = _pluck(_SCHEDULE_FIELDS, _SCHEDULE_DEFAULTS, station)
+            stops.append(Stop(name, code, state, minutes_to_time(std_min), day, platform, is_stop))
 
-        return {
+        # Major stops are the stations where the train actually stops
+        major_stops = [stop for stop in stops if stop.is_stop]
+
+        result = {
             "train_number": train_number,
             "total_stations": len(stops),
             "total_stops": len(major_stops),
             "major_stops": major_stops,
             "full_route": stops
         }
+        with SCHEDULE_CACHE_LOCK:
+            SCHEDULE_CACHE[train_number] = result
+        return _schedule_response(result, include_full_route)
+    except requests.exceptions.Timeout as e:
+        return _timeout_error("get_train_schedule", e)
     except Exception as e:
         logging.error(f"Train Schedule API Error: {e}")
         return {"error": str(e)}
 
 
+def _get_availability(source: str, destination: str, date: str) -> tuple:
+    """
+    Fetch trainAvailability rows for a route and date.
+    Returns (trains, index) where index maps trainNumber -> train row.
+    """
+    key = (source, destination, date)
+    with AVAIL_CACHE_LOCK:
+        cached = AVAIL_CACHE.get(key)
+    if cached:
+        return cached
+
+    url = "https://irctc-api2.p.rapidapi.com/trainAvailability"
+
+    _require_api_key()
+
+    r = SESSION.get(url, params={
+        "source": source,
+        "destination": destination,
+        "date": date
+    }, timeout=LONG_TIMEOUT)
+    r.raise_for_status()
+    data = orjson.loads(r.content).get("data", [])
+
+    # Reversed so the first row wins if a train number appears twice
+    result = (data, {t.get("trainNumber"): t for t in reversed(data)})
+    if data:
+        with AVAIL_CACHE_LOCK:
+            AVAIL_CACHE[key] = result
+    return result
+
+
 @mcp.tool()
 def get_fare(train_number: str, source: str, destination: str, date: str = None) -> dict:
     """
@@ -261,33 +467,19 @@ def get_fare(train_number: str, source: str, destination: str, date: str = None)
     if not train_number or not source or not destination:
         return {"error": "Train number, source, and destination are required"}
 
-    # Use trainAvailability API which includes fare data
-    url = "https://irctc-api2.p.rapidapi.com/trainAvailability"
-
     # Default to a near future date if not provided
     if not date:
-        from datetime import datetime, timedelta
-        tomorrow = datetime.now() + timedelta(days=1)
-        date = tomorrow.strftime("%d-%m-%Y")
+        date = _tomorrow_ddmmyyyy()
 
     try:
-        r = requests.get(url, headers=get_headers(), params={
-            "source": source,
-            "destination": destination,
-            "date": date
-        }, timeout=20)
-        r.raise_for_status()
-        data = r.json().get("data", [])
+        # trainAvailability includes fare data
+        data, train_index = _get_availability(source, destination, date)
 
         if not data:
             return {"error": f"No trains found from {source} to {destination}"}
 
         # Find the specific train
-        train_data = None
-        for train in data:
-            if train.get("trainNumber") == train_number:
-                train_data = train
-                break
+        train_data = train_index.get(train_number)
 
         if not train_data:
             return {"error": f"Train {train_number} not found on route {source} to {destination}"}
@@ -310,6 +502,8 @@ def get_fare(train_number: str, source: str, destination: str, date: str = None)
             "duration": train_data.get("duration", "N/A"),
             "fares_by_class": fares
         }
+    except requests.exceptions.Timeout as e:
+        return _timeout_error("get_fare", e)
     except Exception as e:
         logging.error(f"Fare API Error: {e}")
         return {"error": str(e)}
@@ -325,7 +519,7 @@ def get_live_train_status(train_number: str, date: str = None) -> dict:
 
     train_number = train_number.strip()
 
-    if not train_number.isdigit() or len(train_number) not in [4, 5]:
+    if not _TRAIN_RE.fullmatch(train_number):
         return {"error": "Train number must be 4-5 digits"}
 
     url = "https://irctc-api2.p.rapidapi.com/liveTrainStatus"
@@ -335,9 +529,10 @@ def get_live_train_status(train_number: str, date: str = None) -> dict:
         params["date"] = date
 
     try:
-        r = requests.get(url, headers=get_headers(), params=params, timeout=15)
+        _require_api_key()
+        r = SESSION.get(url, params=params, timeout=SHORT_TIMEOUT)
         r.raise_for_status()
-        data = r.json().get("data", {})
+        data = orjson.loads(r.content).get("data", {})
 
         if not data:
             return {"error": f"No live status found for train {train_number}. Train may not be running today."}
@@ -360,11 +555,23 @@ def get_live_train_status(train_number: str, date: str = None) -> dict:
             "source": data.get("source", "N/A"),
             "destination": data.get("destination", "N/A")
         }
+    except requests.exceptions.Timeout as e:
+        return _timeout_error("get_live_train_status", e)
     except Exception as e:
         logging.error(f"Live Train Status API Error: {e}")
         return {"error": str(e)}
 
 
+_CLASS_DEFAULTS = {
+    "class": "N/A",
+    "displayStatus": "N/A",
+    "availability": "N/A",
+    "fare": "N/A",
+    "prediction": "N/A"
+}
+_CLASS_FIELDS = itemgetter(*_CLASS_DEFAULTS)
+
+
 @mcp.tool()
 def check_seat_availability(source: str, destination: str, date: str, train_number: str = None) -> dict:
     """
@@ -385,16 +592,8 @@ def check_seat_availability(source: str, destination: str, date: str, train_numb
     if not source or not destination or not date:
         return {"error": "Source, destination, and date are required"}
 
-    url = "https://irctc-api2.p.rapidapi.com/trainAvailability"
-
     try:
-        r = requests.get(url, headers=get_headers(), params={
-            "source": source,
-            "destination": destination,
-            "date": date
-        }, timeout=20)
-        r.raise_for_status()
-        data = r.json().get("data", [])
+        data, _ = _get_availability(source, destination, date)
 
         if not data:
             return {"error": f"No trains found from {source} to {destination} on {date}"}
@@ -408,12 +607,13 @@ def check_seat_availability(source: str, destination: str, date: str, train_numb
 
             class_availability = []
             for cls in train.get("classAvailability", []):
+                cls_name, status, availability, fare, prediction = _pluck(_CLASS_FIELDS, _CLASS_DEFAULTS, cls)
                 class_availability.append({
-                    "class": cls.get("class", "N/A"),
-                    "status": cls.get("displayStatus", "N/A"),
-                    "availability": cls.get("availability", "N/A"),
-                    "fare": f"₹{cls.get('fare', 'N/A')}",
-                    "confirmation_chance": cls.get("prediction", "N/A")
+                    "class": cls_name,
+                    "status": status,
+                    "availability": availability,
+                    "fare": f"₹{fare}",
+                    "confirmation_chance": prediction
                 })
 
             trains.append({
@@ -439,16 +639,18 @@ def check_seat_availability(source: str, destination: str, date: str, train_numb
             "trains_found": len(trains),
             "trains": trains
         }
+    except requests.exceptions.Timeout as e:
+        return _timeout_error("check_seat_availability", e)
     except Exception as e:
         logging.error(f"Seat Availability API Error: {e}")
         return {"error": str(e)}
 
 
 # Delhi area stations mapping
-DELHI_STATIONS = ["NDLS", "ANVT", "DLI", "DEE", "DEC", "SZM"]
-MUMBAI_STATIONS = ["CSMT", "BCT", "LTT", "BDTS"]
-KOLKATA_STATIONS = ["HWH", "SDAH", "KOAA"]
-CHENNAI_STATIONS = ["MAS", "MS", "MSB"]
+DELHI_STATIONS = ("NDLS", "ANVT", "DLI", "DEE", "DEC", "SZM")
+MUMBAI_STATIONS = ("CSMT", "BCT", "LTT", "BDTS")
+KOLKATA_STATIONS = ("HWH", "SDAH", "KOAA")
+CHENNAI_STATIONS = ("MAS", "MS", "MSB")
 
 CITY_STATION_MAP = {
     "DELHI": DELHI_STATIONS,
@@ -458,8 +660,91 @@ CITY_STATION_MAP = {
     "CHENNAI": CHENNAI_STATIONS
 }
 
+# Reverse index: station code -> city it belongs to. setdefault keeps the first
+# (canonical) city, so aliases like "NEW DELHI" don't overwrite "DELHI"
+STATION_TO_CITY = {}
+for _city, _codes in CITY_STATION_MAP.items():
+    for _code in _codes:
+        STATION_TO_CITY.setdefault(_code, _city)
+
+# Shared async session for the search_trains fan-out, created lazily on the server's loop
+# and closed by _lifespan when the server shuts down
+_ASYNC_SESSION = None
+_ASYNC_SESSION_LOCK = asyncio.Lock()
+
+
+async def _get_async_session() -> aiohttp.ClientSession:
+    global _ASYNC_SESSION
+    async with _ASYNC_SESSION_LOCK:
+        if _ASYNC_SESSION is None or _ASYNC_SESSION.closed:
+            _ASYNC_SESSION = aiohttp.ClientSession(
+                headers=_HEADERS,
+                connector=aiohttp.TCPConnector(limit=50, limit_per_host=20),
+                timeout=aiohttp.ClientTimeout(total=20, connect=LONG_TIMEOUT[0], sock_read=LONG_TIMEOUT[1])
+            )
+        return _ASYNC_SESSION
+
+
+def _departure_minutes(departure) -> int:
+    """Parse an 'HH:MM' departure into minutes since midnight; unparseable values sort last."""
+    if isinstance(departure, str) and len(departure) >= 5 and departure[2] == ":":
+        try:
+            return int(departure[:2]) * 60 + int(departure[3:5])
+        except ValueError:
+            pass
+    return 10**9
+
+
+_ROUTE_TRAIN_DEFAULTS = {
+    "trainNumber": None,
+    "trainName": "N/A",
+    "from": {},
+    "to": {},
+    "departure": "N/A",
+    "arrival": "N/A",
+    "duration": "N/A",
+    "runningDays": "N/A",
+    # Tuple so the shared default is never mutated; serialized as a JSON array
+    "allClasses": ()
+}
+_ROUTE_TRAIN_FIELDS = itemgetter(*_ROUTE_TRAIN_DEFAULTS)
+
+
+async def _fetch_route_trains(session, sem, url, src, dest, date):
+    """
+    Stream trainAvailability for one (src, dest) pair, keeping only the fields search_trains returns.
+    Returns None on a non-200 response.
+    """
+    async with sem:
+        async with session.get(url, params={
+            "source": src,
+            "destination": dest,
+            "date": date
+        }) as r:
+            if r.status != 200:
+                return None
+
+            trains = []
+            async for t in ijson.items_async(r.content, "data.item", use_float=True):
+                (number, name, from_stn, to_stn, departure,
+                 arrival, duration, run_days, classes) = _pluck(_ROUTE_TRAIN_FIELDS, _ROUTE_TRAIN_DEFAULTS, t)
+                trains.append({
+                    "train_number": number,
+                    "train_name": name,
+                    "source_station": f"{from_stn.get('name', 'N/A')} ({from_stn.get('code', src)})",
+                    "destination_station": f"{to_stn.get('name', 'N/A')} ({to_stn.get('code', dest)})",
+                    "departure": departure,
+                    "arrival": arrival,
+                    "duration": duration,
+                    "run_days": run_days,
+                    "classes": classes,
+                    "_dep_min": _departure_minutes(departure)
+                })
+            return trains
+
+
 @mcp.tool()
-def search_trains(source: str, destination: str, date: str = None) -> dict:
+async def search_trains(source: str, destination: str, date: str = None, max_results: int = 25) -> dict:
     """
     Search for all trains between two stations/cities.
     For major cities (Delhi, Mumbai, Kolkata, Chennai), searches ALL stations in that city.
@@ -468,6 +753,7 @@ def search_trains(source: str, destination: str, date: str = None) -> dict:
     - source: Station CODE (NDLS) or city name (Delhi)
     - destination: Station CODE (HJP) or city name (Mumbai)
     - date: DD-MM-YYYY format (optional, defaults to tomorrow)
+    - max_results: Maximum number of trains to return, earliest departures first (default 25)
     """
     logging.info(f"Searching trains: {source} -> {destination}")
 
@@ -478,68 +764,84 @@ def search_trains(source: str, destination: str, date: str = None) -> dict:
         return {"error": "Source and destination are required"}
 
     # Expand city names to multiple stations
-    source_stations = CITY_STATION_MAP.get(source, [source])
-    dest_stations = CITY_STATION_MAP.get(destination, [destination])
+    source_stations = CITY_STATION_MAP.get(source, (source,))
+    dest_stations = CITY_STATION_MAP.get(destination, (destination,))
+
+    source_city = STATION_TO_CITY.get(source_stations[0])
+    if source_city and source_city == STATION_TO_CITY.get(dest_stations[0]):
+        return {"error": f"{source} and {destination} are in the same city ({source_city.title()})"}
 
     # Use trainAvailability API
     url = "https://irctc-api2.p.rapidapi.com/trainAvailability"
 
     # Default to tomorrow if no date provided
     if not date:
-        from datetime import datetime, timedelta
-        tomorrow = datetime.now() + timedelta(days=1)
-        date = tomorrow.strftime("%d-%m-%Y")
+        date = _tomorrow_ddmmyyyy()
+
+    try:
+        _require_api_key()
+    except ValueError as e:
+        return {"error": str(e)}
+
+    routes = [(src, dest) for src in source_stations for dest in dest_stations if src != dest]
+
+    # Search all combinations of source and destination stations concurrently
+    session = await _get_async_session()
+    sem = asyncio.Semaphore(8)
+    results = await asyncio.gather(
+        *(_fetch_route_trains(session, sem, url, src, dest, date) for src, dest in routes),
+        return_exceptions=True
+    )
 
     all_trains = []
     searched_routes = []
+    seen_train_numbers = set()
 
-    # Search all combinations of source and destination stations
-    for src in source_stations:
-        for dest in dest_stations:
-            try:
-                r = requests.get(url, headers=get_headers(), params={
-                    "source": src,
-                    "destination": dest,
-                    "date": date
-                }, timeout=20)
-
-                if r.status_code == 200:
-                    data = r.json().get("data", [])
-                    searched_routes.append(f"{src} → {dest}")
-
-                    for t in data:
-                        # Avoid duplicates
-                        train_num = t.get("trainNumber")
-                        if not any(tr["train_number"] == train_num for tr in all_trains):
-                            all_trains.append({
-                                "train_number": train_num,
-                                "train_name": t.get("trainName", "N/A"),
-                                "source_station": f"{t.get('from', {}).get('name', 'N/A')} ({t.get('from', {}).get('code', src)})",
-                                "destination_station": f"{t.get('to', {}).get('name', 'N/A')} ({t.get('to', {}).get('code', dest)})",
-                                "departure": t.get("departure", "N/A"),
-                                "arrival": t.get("arrival", "N/A"),
-                                "duration": t.get("duration", "N/A"),
-                                "run_days": t.get("runningDays", "N/A"),
-                                "classes": t.get("allClasses", [])
-                            })
-            except Exception as e:
-                logging.error(f"Error searching {src} to {dest}: {e}")
-                continue
+    # gather() preserves route order, so merged results are deterministic
+    for (src, dest), data in zip(routes, results):
+        if isinstance(data, Exception):
+            logging.error(f"Error searching {src} to {dest}: {data}")
+            continue
+        if data is None:
+            continue
+        searched_routes.append(f"{src} → {dest}")
+
+        for train in data:
+            # Avoid duplicates
+            train_num = train["train_number"]
+            if train_num not in seen_train_numbers:
+                seen_train_numbers.add(train_num)
+                all_trains.append(train)
 
     if not all_trains:
         return {"error": f"No trains found from {source} to {destination}"}
 
-    # Sort by departure time
-    all_trains.sort(key=lambda x: x["departure"])
+    # Sort by departure time, keep the earliest max_results, then drop the internal sort key
+    all_trains.sort(key=itemgetter("_dep_min"))
+    trains = all_trains[:max_results]
+    for train in trains:
+        del train["_dep_min"]
 
     return {
         "search_query": f"{source} to {destination}",
         "routes_searched": searched_routes,
         "date": date,
         "train_count": len(all_trains),
-        "trains": all_trains
+        "trains_returned": len(trains),
+        "trains": trains
     }
 
 
 if __name__ == "__main__":
-    mcp.run()
\ No newline at end of file
+    # One line per startup makes duplicate or missing tool registrations easy to spot
+    logging.info(f"Registered tools: {[tool.name for tool in asyncio.run(mcp.list_tools())]}")
+    # stdio by default (spawned by app.py); MCP_TRANSPORT=http runs it as a standalone server
+    transport = os.getenv("MCP_TRANSPORT", "stdio")
+    if transport == "stdio":
+        mcp.run()
+    else:
+        mcp.run(
+            transport=transport,
+            host=os.getenv("MCP_HOST", "127.0.0.1"),
+            port=int(os.getenv("MCP_PORT", "8000"))
+        )
\ No newline at end of file
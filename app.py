@@ -1,24 +1,42 @@
 import os
 import sys
+import atexit
+import hashlib
+import sqlite3
+import time
+import queue
 import asyncio
+import threading
+import httpx
+import orjson
 import streamlit as st
-import nest_asyncio
 from dotenv import load_dotenv
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+
+# uvloop (libuv) is faster for the agent's subprocess/pipe-heavy workload; not available on Windows
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 # ===============================
-# ENV & ASYNC FIX
+# ENV
 # ===============================
 load_dotenv()
-nest_asyncio.apply()
 
 # ===============================
 # LANGCHAIN / LANGGRAPH
 # ===============================
 from langgraph.graph import StateGraph, START, END, MessagesState
-from langgraph.prebuilt import ToolNode, tools_condition
-from langchain_openai import ChatOpenAI
+from langgraph.prebuilt import tools_condition
+from langgraph.config import get_stream_writer
+from openai import AsyncOpenAI
 from langchain_mcp_adapters.client import MultiServerMCPClient
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_mcp_adapters.tools import load_mcp_tools
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.utils.function_calling import convert_to_openai_tool
 
 # ===============================
 # STREAMLIT UI
@@ -60,6 +78,9 @@ for msg in st.session_state.messages:
 # ===============================
 SERVER_PATH = os.path.abspath("RailwayServer.py")
 
+# When set, connect to an already running server over streamable HTTP instead of spawning one
+RAILWAY_MCP_URL = os.getenv("RAILWAY_MCP_URL")
+
 # ===============================
 # SYSTEM PROMPT
 # ===============================
@@ -85,72 +106,603 @@ Rules:
 6. If a tool returns an error, explain it clearly to the user.
 """
 
+# Built once and prepended to every LLM call
+SYSTEM_MESSAGE = SystemMessage(content=SYSTEM_PROMPT)
+
 # ===============================
-# AGENT FUNCTION (FIXED)
+# BACKGROUND EVENT LOOP
 # ===============================
-async def run_agent(user_input: str):
+@st.cache_resource
+def get_background_loop():
+    """
+    One long-lived event loop on a daemon thread, shared by every rerun.
+    Clients created inside coroutines stay bound to it, so their connection
+    pools survive across turns instead of dying with a per-turn loop.
+    """
+    loop = uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="agent-loop", daemon=True).start()
 
-    # 1. Initialize Client (Standard Instantiation)
-    client = MultiServerMCPClient({
-        "railway": {
-            "command": sys.executable,
-            "args": [SERVER_PATH],
-            "transport": "stdio",
-            "env": {**os.environ, "PYTHONUNBUFFERED": "1"}
-        }
-    })
-
-    # 2. Get tools directly (This handles the connection internally in v0.1.0)
-    # The error message suggests: "client = MultiServerMCPClient(...) tools = await client.get_tools()"
-    tools = await client.get_tools()
-
-    # 3. Build the Agent
-    llm = ChatOpenAI(
-        model="gpt-4o-mini", 
-        temperature=0
-    ).bind_tools(tools)
-
-    def agent(state: MessagesState):
-        return {
-            "messages": [
-                llm.invoke(
-                    [SystemMessage(content=SYSTEM_PROMPT)] 
-                    + state["messages"]
-                )
+    def shutdown():
+        # Registered first, so it runs after the MCP session / client cleanups
+        async def drain():
+            await loop.shutdown_asyncgens()
+            await loop.shutdown_default_executor()
+        try:
+            asyncio.run_coroutine_threadsafe(drain(), loop).result(timeout=5)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+
+    atexit.register(shutdown)
+    return loop
+
+
+def run_in_loop(coro):
+    """Run a coroutine on the background loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, get_background_loop()).result()
+
+
+# ===============================
+# LLM CLIENT (BUILT ONCE)
+# ===============================
+MODEL = "gpt-4o-mini"
+
+
+@st.cache_resource
+def get_llm():
+    """
+    Shared OpenAI client. Its httpx pool is only ever used on the
+    background loop, so keep-alive connections to the API survive across turns.
+    """
+    http_client = httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=20))
+    atexit.register(lambda: asyncio.run_coroutine_threadsafe(
+        http_client.aclose(), get_background_loop()
+    ).result(timeout=5))
+    return AsyncOpenAI(http_client=http_client)
+
+
+# ===============================
+# OPENAI MESSAGE CONVERSION
+# ===============================
+def to_openai_message(message) -> dict:
+    """Map a LangChain message to the chat completions wire format."""
+    if message.type == "tool":
+        content = message.content
+        if not isinstance(content, str):
+            # MCP results arrive as content blocks; the API wants plain text here
+            content = "".join(block.get("text", "") for block in content if isinstance(block, dict))
+        return {"role": "tool", "tool_call_id": message.tool_call_id, "content": content}
+
+    if message.type == "ai":
+        result = {"role": "assistant", "content": message.content or None}
+        if message.tool_calls:
+            result["tool_calls"] = [
+                {
+                    "id": call["id"],
+                    "type": "function",
+                    "function": {"name": call["name"], "arguments": orjson.dumps(call["args"]).decode()}
+                }
+                for call in message.tool_calls
             ]
-        }
+        return result
+
+    role = "user" if message.type == "human" else message.type
+    return {"role": role, "content": message.content}
+
+
+def to_ai_message(response_id, content: str, calls: dict, finish_reason) -> AIMessage:
+    """Assemble the streamed pieces of one completion into an AIMessage for the graph."""
+    tool_calls, invalid_tool_calls = [], []
+    for call in calls.values():
+        try:
+            tool_calls.append({"name": call["name"], "args": orjson.loads(call["arguments"] or "{}"), "id": call["id"]})
+        except orjson.JSONDecodeError as e:
+            invalid_tool_calls.append({**call, "args": call["arguments"], "error": str(e)})
+    return AIMessage(
+        content=content,
+        tool_calls=tool_calls,
+        invalid_tool_calls=invalid_tool_calls,
+        id=response_id,
+        response_metadata={"model_name": MODEL, "finish_reason": finish_reason}
+    )
+
+
+# ===============================
+# LLM RESPONSE CACHE
+# ===============================
+# Set LLM_CACHE_PATH to an empty string to disable
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".llm_cache.db")
+# Seconds a cached reply stays valid, so a bad answer is not replayed forever
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))
+
+
+class LLMResponseCache:
+    """
+    SQLite cache of agent-node replies. With temperature=0 the same prompt,
+    history and tool schemas give the same reply, so repeated questions skip
+    the API call. Tool results are part of the history, so live data is
+    never answered from a stale entry. Entries expire after `ttl` seconds.
+
+    get/put are coroutines that run the SQLite calls in a worker thread so
+    the background loop keeps streaming while the disk is busy.
+    """
+
+    def __init__(self, path: str, ttl: int):
+        self.ttl = ttl
+        # One connection shared by the worker threads, used under a lock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # Superseded by "replies", whose rows carry a creation time
+        self._db.execute("DROP TABLE IF EXISTS responses")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS replies "
+            "(key TEXT PRIMARY KEY, message BLOB NOT NULL, created REAL NOT NULL)"
+        )
+        self._db.execute("DELETE FROM replies WHERE created < ?", (time.time() - ttl,))
+        self._db.commit()
+
+    @staticmethod
+    def _content(message):
+        # MCP tool results are content blocks, each stamped with a random id
+        if isinstance(message.content, str):
+            return message.content
+        return [
+            {k: v for k, v in block.items() if k != "id"} if isinstance(block, dict) else block
+            for block in message.content
+        ]
+
+    @classmethod
+    def key(cls, messages, tools_hash: str) -> str:
+        # Only what the model sees - ids and usage metadata differ between identical turns
+        payload = orjson.dumps([
+            [m.type, cls._content(m), getattr(m, "tool_calls", None), getattr(m, "tool_call_id", None)]
+            for m in messages
+        ], option=orjson.OPT_SORT_KEYS, default=str)
+        return hashlib.sha256(tools_hash.encode() + payload).hexdigest()
+
+    def _get(self, key: str):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT message FROM replies WHERE key = ? AND created >= ?",
+                (key, time.time() - self.ttl)
+            ).fetchone()
+        return messages_from_dict([orjson.loads(row[0])])[0] if row else None
+
+    def _put(self, key: str, message):
+        blob = orjson.dumps(message_to_dict(message), default=str)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO replies (key, message, created) VALUES (?, ?, ?)",
+                (key, blob, time.time())
+            )
+            self._db.commit()
+
+    async def get(self, key: str):
+        return await asyncio.to_thread(self._get, key)
+
+    async def put(self, key: str, message):
+        await asyncio.to_thread(self._put, key, message)
+
+
+@st.cache_resource
+def get_llm_cache():
+    return LLMResponseCache(LLM_CACHE_PATH, LLM_CACHE_TTL) if LLM_CACHE_PATH else None
+
+
+# ===============================
+# AGENT GRAPH (BUILT ONCE)
+# ===============================
+@st.cache_resource
+def build_app(server_path: str, generation: int, _tools, _client):
+    """Compile the agent graph once per MCP session; server_path and generation are the cache key."""
+
+    cache = get_llm_cache()
+    tool_schemas = [convert_to_openai_tool(tool) for tool in _tools]
+    # The reply also depends on the model and the tools it may call
+    tools_hash = hashlib.sha256(orjson.dumps(
+        [MODEL, *tool_schemas], option=orjson.OPT_SORT_KEYS
+    )).hexdigest()
+    tool_kwargs = {"tools": tool_schemas} if tool_schemas else {}
+
+    async def call_llm(messages, writers):
+        # Tokens go out through each waiter's "custom" stream so the UI can render them as they arrive
+        content, calls = [], {}
+        response_id = finish_reason = None
+
+        async with await _client.chat.completions.create(
+            model=MODEL,
+            temperature=0,
+            messages=[to_openai_message(m) for m in messages],
+            stream=True,
+            **tool_kwargs
+        ) as stream:
+            async for chunk in stream:
+                response_id = chunk.id
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                finish_reason = choice.finish_reason or finish_reason
+
+                if choice.delta.content:
+                    content.append(choice.delta.content)
+                    for write in writers:
+                        write((response_id, choice.delta.content))
+
+                # Tool calls are streamed in fragments keyed by their index
+                for part in choice.delta.tool_calls or ():
+                    call = calls.setdefault(part.index, {"id": None, "name": "", "arguments": ""})
+                    if part.id:
+                        call["id"] = part.id
+                    if part.function:
+                        call["name"] += part.function.name or ""
+                        call["arguments"] += part.function.arguments or ""
+
+        return to_ai_message(response_id, "".join(content), calls, finish_reason)
+
+    async def fetch(key, messages, writers):
+        response = await call_llm(messages, writers)
+        if cache is not None:
+            await cache.put(key, response)
+        return response
+
+    # key -> (task, writers) for LLM calls in progress; only touched on the background loop
+    inflight = {}
+
+    def forget(key, entry):
+        # A finished or abandoned call must not evict a newer call for the same key
+        if inflight.get(key) is entry:
+            del inflight[key]
+
+    async def single_flight(key, messages):
+        """
+        Share one API call between identical requests that overlap (tabs, retries).
+        The task runs in the first caller's context, so each waiter registers its
+        own stream writer and tokens are fanned out to all of them; one that joins
+        mid-stream still gets the full reply, just not the tokens sent before it.
+        """
+        entry = inflight.get(key)
+        if entry is None:
+            writers = []
+            entry = inflight[key] = (asyncio.create_task(fetch(key, messages, writers)), writers)
+            entry[0].add_done_callback(lambda _, e=entry: forget(key, e))
+        task, writers = entry
+        writer = get_stream_writer()
+        writers.append(writer)
+        try:
+            # Shielded so one cancelled caller does not cancel the call for the others
+            return await asyncio.shield(task)
+        finally:
+            writers.remove(writer)
+            if not writers and not task.done():
+                # Last waiter gone: unregister now so the next identical request
+                # starts a fresh call instead of joining the cancelled one
+                forget(key, entry)
+                task.cancel()
+
+    async def agent(state: MessagesState):
+        messages = [SYSTEM_MESSAGE, *state["messages"]]
+        key = LLMResponseCache.key(messages, tools_hash)
+
+        response = await cache.get(key) if cache is not None else None
+        if response is None:
+            response = await single_flight(key, messages)
+        return {"messages": [response]}
+
+    tools_by_name = {tool.name: tool for tool in _tools}
+    # MCP tools carry JSON-schema dicts; compile each validator once instead of per call
+    validators = {
+        tool.name: validator_for(tool.args_schema)(tool.args_schema)
+        for tool in _tools if isinstance(tool.args_schema, dict)
+    }
+
+    async def run_tool(call):
+        tool = tools_by_name.get(call["name"])
+        if tool is None:
+            return ToolMessage(
+                content=f"Error: unknown tool '{call['name']}'",
+                name=call["name"], tool_call_id=call["id"], status="error"
+            )
+        validator = validators.get(call["name"])
+        if validator is not None:
+            # Reject malformed arguments here rather than after a round-trip to the server
+            error = best_match(validator.iter_errors(call["args"]))
+            if error is not None:
+                return ToolMessage(
+                    content=f"Error: invalid arguments for '{call['name']}': {error.message}",
+                    name=call["name"], tool_call_id=call["id"], status="error"
+                )
+        try:
+            # Invoking with the full tool call returns a ToolMessage tied to its id
+            return await tool.ainvoke(call)
+        except Exception as e:
+            return ToolMessage(
+                content=f"Error: {e}",
+                name=call["name"], tool_call_id=call["id"], status="error"
+            )
+
+    async def parallel_tools(state: MessagesState):
+        # The LLM can request several tools in one turn; run them together
+        tool_calls = state["messages"][-1].tool_calls
+        results = await asyncio.gather(*(run_tool(call) for call in tool_calls))
+        return {"messages": list(results)}
 
     graph = StateGraph(MessagesState)
     graph.add_node("agent", agent)
-    graph.add_node("tools", ToolNode(tools))
+    graph.add_node("tools", parallel_tools)
 
     graph.add_edge(START, "agent")
     graph.add_conditional_edges("agent", tools_condition)
     graph.add_edge("tools", "agent")
 
-    app = graph.compile()
+    return graph.compile()
+
+
+# ===============================
+# PERSISTENT MCP SESSION
+# ===============================
+class MCPConnection:
+    """
+    Keeps one session to an MCP server open on the background loop.
+    Without it every tool call opens a new connection (spawning a fresh
+    server process over stdio) and repeats the initialize handshake.
+    """
+
+    def __init__(self, client: MultiServerMCPClient, server_name: str):
+        self.client = client
+        self.server_name = server_name
+        self.session = None
+        self.tools = []
+        self.generation = 0
+        self._task = None
+        self._closing = None
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        ready = asyncio.get_running_loop().create_future()
+        self._closing = asyncio.Event()
+        # The session context must be entered and exited by the same task
+        self._task = asyncio.create_task(self._hold(ready))
+        await ready
+        self.generation += 1
+
+    async def _hold(self, ready):
+        try:
+            async with self.client.session(self.server_name) as session:
+                self.tools = await load_mcp_tools(session, server_name=self.server_name)
+                self.session = session
+                ready.set_result(None)
+                await self._closing.wait()
+        except BaseException as e:
+            if not ready.done():
+                ready.set_exception(e)
+            raise
+        finally:
+            self.session = None
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._closing.set()
+        try:
+            await self._task
+        except BaseException:
+            pass
+        self._task = None
+
+    async def is_alive(self, timeout: float = 2.0) -> bool:
+        if self.session is None:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout)
+            return True
+        except Exception:
+            return False
+
+    async def ensure(self):
+        """Ping the server and reconnect if the session has died."""
+        async with self._lock:
+            if not await self.is_alive():
+                await self.close()
+                await self.start()
+
+
+def mcp_http_client(headers=None, timeout=None, auth=None):
+    """httpx client for the streamable HTTP transport, keeping connections alive between calls."""
+    return httpx.AsyncClient(
+        headers=headers,
+        timeout=timeout or httpx.Timeout(30.0, read=300.0),
+        auth=auth,
+        follow_redirects=True,
+        limits=httpx.Limits(max_keepalive_connections=10)
+    )
+
+
+@st.cache_resource
+def get_mcp_connection():
+    if RAILWAY_MCP_URL:
+        # Long-lived server started separately (MCP_TRANSPORT=http python RailwayServer.py)
+        connection = {
+            "transport": "streamable_http",
+            "url": RAILWAY_MCP_URL,
+            "httpx_client_factory": mcp_http_client
+        }
+    else:
+        connection = {
+            "command": sys.executable,
+            "args": [SERVER_PATH],
+            "transport": "stdio",
+            "env": {**os.environ, "PYTHONUNBUFFERED": "1"}
+        }
+    client = MultiServerMCPClient({"railway": connection})
+    conn = MCPConnection(client, "railway")
+    run_in_loop(conn.start())
+    # Leave the session context cleanly so the server process is reaped
+    atexit.register(lambda: asyncio.run_coroutine_threadsafe(
+        conn.close(), get_background_loop()
+    ).result(timeout=5))
+    return conn
+
+
+# ===============================
+# MCP CLIENT & AGENT (CACHED PER SESSION)
+# ===============================
+def get_mcp_client():
+    """
+    Check the shared MCP session is healthy, then return the tools and
+    compiled graph for it. They are kept in st.session_state and only rebuilt
+    when the session had to be recreated.
+    """
+    conn = get_mcp_connection()
+    run_in_loop(conn.ensure())
+
+    cache = st.session_state.setdefault("mcp_cache", {})
+    entry = cache.get(SERVER_PATH)
+    if entry is not None and entry["generation"] == conn.generation:
+        return entry
+
+    cache[SERVER_PATH] = {
+        "client": conn.client,
+        "generation": conn.generation,
+        "tools": conn.tools,
+        "app": build_app(SERVER_PATH, conn.generation, conn.tools, get_llm())
+    }
+    return cache[SERVER_PATH]
+
+
+# ===============================
+# AGENT FUNCTION
+# ===============================
+# Marks the end of a run on its events queue. A plain value rather than object():
+# Streamlit re-executes this file on every rerun, and a run started by an earlier
+# rerun (see cancel_inflight) must still be recognised when it finishes.
+_DONE = "__agent_run_done__"
+
+
+async def run_agent(app, user_input: str, events: queue.Queue):
+    """Stream graph events into `events`. Runs on the background loop."""
+    # "custom" yields LLM tokens as they arrive, "updates" yields per-node results
+    stream = app.astream(
+        {"messages": [HumanMessage(content=user_input)]},
+        stream_mode=["custom", "updates"]
+    )
+    try:
+        async for event in stream:
+            events.put(event)
+    except asyncio.CancelledError:
+        # Close the graph stream so pending LLM / MCP calls are torn down too
+        await stream.aclose()
+        raise
+    finally:
+        events.put(_DONE)
+
+
+def cancel_inflight(timeout: float = 5.0):
+    """
+    Cancel a previous turn that is still running. Streamlit abandons the
+    script when the user sends a new message mid-answer, but the coroutine
+    on the background loop would otherwise keep spending tokens.
+    """
+    inflight = st.session_state.pop("inflight", None)
+    if inflight is None:
+        return
+
+    future, events = inflight
+    if future.done():
+        return
+
+    future.cancel()
+    # Wait (bounded) for run_agent to unwind and signal it is finished
+    deadline = time.monotonic() + timeout
+    while (remaining := deadline - time.monotonic()) > 0:
+        try:
+            if events.get(timeout=remaining) == _DONE:
+                break
+        except queue.Empty:
+            break
+
+
+# Redraw the status box / streamed answer at most this often (seconds) or every N events
+STATUS_FLUSH_INTERVAL = 0.1
+STATUS_FLUSH_EVERY = 20
+
+# Show tool arguments in the status box (useful while debugging prompts)
+VERBOSE = bool(os.getenv("VERBOSE"))
+
+
+def ask_agent(user_input: str):
+    """
+    Run the agent on the background loop and render its progress here.
+    Streamlit calls must stay on the script thread, so events are handed
+    over through a queue rather than drawn from inside the coroutine.
+    """
+    app = get_mcp_client()["app"]
+    events = queue.Queue()
+    future = asyncio.run_coroutine_threadsafe(
+        run_agent(app, user_input, events), get_background_loop()
+    )
+    st.session_state.inflight = (future, events)
 
     final_response = None
+    streamed_id, buffer = None, ""
+    status_lines = []
+    pending, last_flush = 0, time.monotonic()
+
+    # Run the Agent with UI Streaming - status box first, answer streams in below it
+    status = st.status("🧠 AI is processing...", expanded=True)
+    answer = st.empty()
+
+    with status:
+        # One placeholder for all status lines, redrawn at most every STATUS_FLUSH_INTERVAL
+        status_log = st.empty()
 
-    # 4. Run the Agent with UI Streaming
-    with st.status("🧠 AI is processing...", expanded=True) as status:
-        async for event in app.astream(
-            {"messages": [HumanMessage(content=user_input)]}
-        ):
+        while True:
+            try:
+                event = events.get(timeout=STATUS_FLUSH_INTERVAL)
+            except queue.Empty:
+                event = None
+            if event == _DONE:
+                break
 
-            if "agent" in event:
-                msg = event["agent"]["messages"][0]
-                if msg.tool_calls:
+            if event is not None:
+                pending += 1
+
+            # Every event is (mode, payload) and an update holds a single node's output
+            match event:
+                case ("custom", (response_id, text)):
+                    # Start a fresh buffer for each new LLM message
+                    if response_id != streamed_id:
+                        streamed_id, buffer = response_id, ""
+                    buffer += text
+
+                case ("updates", {"agent": {"messages": [msg, *_]}}) if msg.tool_calls:
                     for tool in msg.tool_calls:
-                        status.write(f"🛠️ Calling tool: `{tool['name']}`")
-                        status.write(f"Arguments: {tool['args']}")
+                        line = f"🛠️ Calling tool: `{tool['name']}`"
+                        if VERBOSE:
+                            line += f"  \nArguments: {tool['args']}"
+                        status_lines.append(line)
+
+                case ("updates", {"agent": {"messages": [msg, *_]}}):
+                    final_response = msg.content
+
+                case ("updates", {"tools": {"messages": tool_messages}}):
+                    for msg in tool_messages:
+                        status_lines.append(f"✅ Tool `{msg.name}` executed")
 
-            if "tools" in event:
-                for msg in event["tools"]["messages"]:
-                    status.write(f"✅ Tool `{msg.name}` executed")
+            # Each Streamlit write is a websocket push, so batch events into one redraw
+            if pending and (
+                pending >= STATUS_FLUSH_EVERY
+                or time.monotonic() - last_flush >= STATUS_FLUSH_INTERVAL
+            ):
+                status_log.markdown("  \n".join(status_lines))
+                if buffer:
+                    answer.markdown(buffer)
+                pending, last_flush = 0, time.monotonic()
 
-            if "agent" in event and not event["agent"]["messages"][0].tool_calls:
-                final_response = event["agent"]["messages"][0].content
+        status_log.markdown("  \n".join(status_lines))
+
+        # Surface any exception raised inside the agent run
+        st.session_state.pop("inflight", None)
+        future.result()
 
         status.update(
             label="✅ Processing Complete", 
@@ -158,9 +710,10 @@ async def run_agent(user_input: str):
             expanded=False
         )
 
-    # 5. Cleanup manually if needed (though get_tools usually handles transient connections)
-    # For long-running apps, Python garbage collection typically cleans up the subprocess,
-    # but strictly speaking, we rely on the client destructor here.
+    # Make sure the complete answer is shown even if no tokens were streamed
+    if final_response:
+        answer.markdown(final_response)
+
     return final_response
 
 
@@ -168,6 +721,8 @@ async def run_agent(user_input: str):
 # CHAT INPUT
 # ===============================
 if query := st.chat_input(" "):
+    cancel_inflight()
+
     st.session_state.messages.append(
         {"role": "user", "content": query}
     )
@@ -177,11 +732,9 @@ if query := st.chat_input(" "):
 
     with st.chat_message("assistant"):
         try:
-            loop = asyncio.get_event_loop()
-            response = loop.run_until_complete(run_agent(query))
+            response = ask_agent(query)
 
             if response:
-                st.markdown(response)
                 st.session_state.messages.append(
                     {"role": "assistant", "content": response}
                 )